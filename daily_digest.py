@@ -1,16 +1,25 @@
 import os
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
+import time
+import threading
 import yfinance as yf
 import pandas as pd
+import numpy as np
 from datetime import datetime
-from deep_translator import GoogleTranslator
+from concurrent.futures import ThreadPoolExecutor
 
 # ================= 設定區 =================
 NEWS_API_KEY = os.getenv("NEWS_API_KEY")
-translator = GoogleTranslator(source='auto', target='zh-TW')
+translators = threading.local()  # 真的有標題要翻才載入 deep_translator
+SESSION = requests.Session()  # 共用連線池，省掉重複的 TLS 握手
+SESSION.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])))
+HTTP_TIMEOUT = (3, 10)  # (連線, 讀取) 秒
 RSI_PERIOD = 14 
 SMA_PERIOD = 50 
+OUTPUT_PATH = "daily_news.json"
 
 WATCHLIST = {
     "indices": {
@@ -51,80 +60,151 @@ WATCHLIST = {
     }
 }
 
+# 新聞查詢 (加入 shipping, freight 關鍵字)，交給 requests 做 URL 編碼
+NEWS_URL = "https://newsapi.org/v2/everything"
+NEWS_PARAMS = {
+    "q": " OR ".join(["market crash", "bitcoin", "nvidia", "federal reserve", "inflation", "shipping rates", "freight cost"]),
+    "domains": "bloomberg.com,reuters.com,cnbc.com,coindesk.com,wsj.com,finance.yahoo.com,gcaptain.com",
+    "sortBy": "publishedAt",
+    "pageSize": 30,
+    "apiKey": NEWS_API_KEY
+}
+
 # ================= 1. 技術分析函數 =================
-def calculate_technicals(ticker_symbol):
+def calculate_technicals(name, hist, with_trend=True):
     try:
-        ticker = yf.Ticker(ticker_symbol)
-        hist = ticker.history(period="3mo")
-        if len(hist) < SMA_PERIOD: return None
+        closes = hist['Close'].dropna().to_numpy()  # 批次下載會把各市場交易日對齊，休市日是 NaN
+        if len(closes) < SMA_PERIOD: return None
 
         # 數據
-        price = hist['Close'].iloc[-1]
-        change = price - hist['Close'].iloc[-2]
-        pct_change = (change / hist['Close'].iloc[-2]) * 100
-
-        # RSI
-        delta = hist['Close'].diff(1)
-        gain = (delta.where(delta > 0, 0)).rolling(window=RSI_PERIOD).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(window=RSI_PERIOD).mean()
-        rs = gain / loss
-        current_rsi = (100 - (100 / (1 + rs))).iloc[-1]
-
-        # SMA Trend
-        current_sma = hist['Close'].rolling(window=SMA_PERIOD).mean().iloc[-1]
-        trend = "震盪"
-        if price > current_sma * 1.01: trend = "📈 多頭"
-        elif price < current_sma * 0.99: trend = "📉 空頭"
+        price, prev = closes[-1], closes[-2]
+        change = price - prev
+        pct_change = (change / prev) * 100
+
+        # RSI (最近 RSI_PERIOD 天漲跌的簡單平均，只算最後一個值)
+        delta = np.diff(closes[-(RSI_PERIOD + 1):])
+        gain = delta[delta > 0].sum() / RSI_PERIOD
+        loss = -delta[delta < 0].sum() / RSI_PERIOD
+        with np.errstate(divide='ignore', invalid='ignore'):
+            current_rsi = 100 - (100 / (1 + gain / loss))
+
+        # SMA Trend (VIX、期貨、匯率不看趨勢，直接給 "-")
+        trend = "-"
+        if with_trend:
+            current_sma = closes[-SMA_PERIOD:].mean()
+            trend = "震盪"
+            if price > current_sma * 1.01: trend = "📈 多頭"
+            elif price < current_sma * 0.99: trend = "📉 空頭"
 
         return {
-            "price": float(f"{price:.2f}"),
-            "change": float(f"{change:.2f}"),
-            "percent": float(f"{pct_change:.2f}"),
+            "name": name,
+            "price": round(float(price), 2),
+            "change": round(float(change), 2),
+            "percent": round(float(pct_change), 2),
             "rsi": f"{current_rsi:.1f}" if not pd.isna(current_rsi) else "-",
             "trend": trend
         }
     except: return None
 
+def download_histories(symbols, attempts=2):
+    # 全部 symbol 一次批次下載 (yfinance 內部多執行緒)，被限流沒拿到的再補抓
+    histories = {}
+    for attempt in range(attempts):
+        todo = [s for s in symbols if s not in histories]
+        if not todo: break
+        if attempt: time.sleep(2)
+        try:
+            bulk = yf.download(todo, period="3mo", group_by='ticker', auto_adjust=True,
+                               threads=True, progress=False, timeout=HTTP_TIMEOUT[1])
+        except: continue
+        for s in todo:
+            if s in bulk and bulk[s]['Close'].notna().any(): histories[s] = bulk[s]
+    return histories
+
 def get_trader_data():
     print("📊 計算全球數據中...")
     all_data = {k: [] for k in WATCHLIST.keys()}
-    
-    for category, items in WATCHLIST.items():
-        for name, symbol in items.items():
-            data = calculate_technicals(symbol)
-            if data:
-                if "VIX" in name or "=" in symbol: 
-                    data["trend"] = "-"
-                
-                all_data[category].append({"name": name, **data})
-                print(f"   ✅ {name} Done")
+    jobs = [(category, name, symbol) for category, items in WATCHLIST.items() for name, symbol in items.items()]
+
+    histories = download_histories([symbol for _, _, symbol in jobs])
+
+    for category, name, symbol in jobs:
+        with_trend = not ("VIX" in name or "=" in symbol)
+        data = calculate_technicals(name, histories[symbol], with_trend) if symbol in histories else None
+        if data:
+            all_data[category].append(data)
+            print(f"   ✅ {name} Done")
     return all_data
 
 # ================= 2. 恐慌指數 =================
 def get_crypto_sentiment():
     try:
-        res = requests.get("https://api.alternative.me/fng/").json()
+        res = SESSION.get("https://api.alternative.me/fng/", timeout=HTTP_TIMEOUT).json()
         return res['data'][0]
     except: return {"value": "-", "status": "Unknown"}
 
 # ================= 3. 新聞 =================
+def get_translator():
+    # GoogleTranslator 把查詢參數存在 instance 上，不能跨 thread 共用，每個 thread 各建一個
+    if not hasattr(translators, "google"):
+        from deep_translator import GoogleTranslator
+        translators.google = GoogleTranslator(source='auto', target='zh-TW')
+    return translators.google
+
+def _translate_one(title):
+    try: return get_translator().translate(title)
+    except: return title
+
+def translate_titles(titles):
+    # 所有標題用換行串起來一次翻譯，拆回後數量對不上才逐條翻
+    titles = [(t or "").replace("\n", " ") for t in titles]
+    if not titles: return []
+    try:
+        parts = get_translator().translate("\n".join(titles)).split("\n")
+        if len(parts) == len(titles): return [p.strip() for p in parts]
+    except: pass
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        return list(executor.map(_translate_one, titles))
+
+def dedupe_articles(articles):
+    # 同一篇常被多個來源轉載：網址或標題重複就只留第一篇
+    seen, unique = set(), []
+    for art in articles:
+        url, title = art.get('url'), (art.get('title') or "").strip().lower()
+        if url in seen or title in seen: continue
+        seen.update((url, title))
+        unique.append(art)
+    return unique
+
+def is_chinese(text):
+    return any('\u4e00' <= c <= '\u9fff' for c in text)
+
+def load_translated_titles():
+    # 上一版輸出的標題已翻好，用 link 對回來就不用重翻
+    try:
+        with open(OUTPUT_PATH, encoding="utf-8") as f:
+            news = json.load(f).get("news", [])
+        return {n['link']: n['title'] for n in news if is_chinese(n['title'])}
+    except: return {}
+
 def get_quick_news():
     if not NEWS_API_KEY: return []
     print("📰 抓新聞...")
-    # 加入 shipping, freight 關鍵字
-    queries = ["market crash", "bitcoin", "nvidia", "federal reserve", "inflation", "shipping rates", "freight cost"]
-    query_str = " OR ".join(queries)
-    domains = "bloomberg.com,reuters.com,cnbc.com,coindesk.com,wsj.com,finance.yahoo.com,gcaptain.com"
-    url = f"https://newsapi.org/v2/everything?q={query_str}&domains={domains}&sortBy=publishedAt&pageSize=30&apiKey={NEWS_API_KEY}"
-    
     news_list = []
     try:
-        res = requests.get(url).json()
-        for art in res.get("articles", [])[:20]: 
+        res = SESSION.get(NEWS_URL, params=NEWS_PARAMS, timeout=HTTP_TIMEOUT).json()
+        # 下架文章 NewsAPI 會回 "[Removed]" 佔位，沒標題的也不用翻
+        articles = [art for art in res.get("articles", []) if art.get('title') and art['title'] != "[Removed]"]
+        articles = dedupe_articles(articles)[:20]
+        translated = load_translated_titles()
+        translated.update({art.get('url'): art['title'] for art in articles if is_chinese(art['title'])})  # 本來就是中文不用翻
+        todo = [art for art in articles if art.get('url') not in translated]
+        translated.update(zip([art.get('url') for art in todo], translate_titles([art['title'] for art in todo])))
+        for art in articles:
             try:
-                title_zh = translator.translate(art['title'])
                 news_list.append({
-                    "title": title_zh, "source": art['source']['name'],
+                    "title": translated[art.get('url')], "source": art['source']['name'],
                     "time": art['publishedAt'][11:16], "link": art['url']
                 })
             except: continue
@@ -134,13 +214,20 @@ def get_quick_news():
 # ================= 4. 主程式 =================
 if __name__ == "__main__":
     print("🚀 啟動 God Mode v21 (Shipping)...")
-    data = get_trader_data()
+    # 三個來源互不相關，同時抓
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        data_job = executor.submit(get_trader_data)
+        fng_job = executor.submit(get_crypto_sentiment)
+        news_job = executor.submit(get_quick_news)
     final_output = {
         "update_time": datetime.now().strftime("%Y-%m-%d %H:%M"),
-        "crypto_fng": get_crypto_sentiment(),
-        "data": data,
-        "news": get_quick_news()
+        "crypto_fng": fng_job.result(),
+        "data": data_job.result(),
+        "news": news_job.result()
     }
-    with open("daily_news.json", "w", encoding="utf-8") as f:
+    # 先寫暫存檔再原子替換，中途被砍也不會留下寫一半的 JSON
+    tmp_path = OUTPUT_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
         json.dump(final_output, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, OUTPUT_PATH)
     print("🎉 完成！")